@@ -0,0 +1,194 @@
+from fastapi import HTTPException
+import asyncio
+import httpx
+import orjson
+import os
+import time
+from dotenv import load_dotenv
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Load environment variables
+load_dotenv()
+
+# Get API key
+COINMARKETCAP_API_KEY = os.getenv("COINMARKETCAP_API_KEY")
+COINMARKETCAP_BASE_URL = "https://pro-api.coinmarketcap.com/v1"
+
+# Every uvicorn worker opens its own connection pool, so size it per worker:
+#   HTTP_POOL = CoinMarketCap rate limit (concurrent calls) / WEB_CONCURRENCY (workers default to 2 * cores + 1)
+HTTP_POOL = int(os.getenv("HTTP_POOL", "30"))
+HTTP_KEEPALIVE = int(os.getenv("HTTP_KEEPALIVE", "10"))
+
+# Response cache TTLs (seconds) per endpoint, matched to how fast the data changes
+TTL = {
+    "cryptocurrency/quotes/latest": 30,
+    "global-metrics/quotes/latest": 60,
+    "cryptocurrency/news": 120
+}
+DEFAULT_TTL = 30
+CACHE_MAX_SIZE = 256
+
+# (endpoint, params) -> (expiry, task); concurrent callers share the same in-flight task
+_response_cache: "OrderedDict[Tuple, Tuple[float, asyncio.Task]]" = OrderedDict()
+
+# Optional Redis server shared by all workers as a second cache tier
+REDIS_URL = os.getenv("REDIS_URL")
+# Keep Redis timeouts short so an outage falls through to MongoDB/CoinMarketCap instead of hanging requests
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.2"))
+
+# In-process cache in front of Redis; entries live at most LOCAL_CACHE_TTL seconds
+LOCAL_CACHE_TTL = 5
+LOCAL_CACHE_MAX_SIZE = 256
+
+# key -> (expiry, serialized value)
+_local_cache: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+# Shared Redis client, created on app startup when REDIS_URL is set
+redis_client: Optional[Redis] = None
+
+# Shared HTTP client, created on app startup and closed on shutdown
+http_client: Optional[httpx.AsyncClient] = None
+
+async def start_http_client():
+    """
+    Create the shared keep-alive HTTP client used for all CoinMarketCap calls
+    """
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            base_url=COINMARKETCAP_BASE_URL,
+            headers={
+                "X-CMC_PRO_API_KEY": COINMARKETCAP_API_KEY,
+                "Accept": "application/json"
+            },
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=HTTP_KEEPALIVE, max_connections=HTTP_POOL)
+        )
+    return http_client
+
+async def close_http_client():
+    """
+    Close the shared HTTP client and release its connection pool
+    """
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+async def _request_coinmarketcap(endpoint: str, params: dict = None) -> Dict:
+    """
+    Perform the actual HTTP request to CoinMarketCap
+    """
+    client = http_client or await start_http_client()
+
+    try:
+        response = await client.get(f"/{endpoint}", params=params)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching data from CoinMarketCap: {str(e)}")
+
+async def fetch_from_coinmarketcap(endpoint: str, params: dict = None) -> Dict:
+    """
+    Helper function to fetch data from CoinMarketCap API.
+    Responses are cached per endpoint TTL and duplicate concurrent calls share one request.
+    """
+    key = (endpoint, frozenset((params or {}).items()))
+    loop = asyncio.get_running_loop()
+
+    entry = _response_cache.get(key)
+    if entry is not None:
+        expiry, task = entry
+        if expiry > loop.time():
+            _response_cache.move_to_end(key)
+            return await asyncio.shield(task)
+        del _response_cache[key]
+
+    task = loop.create_task(_request_coinmarketcap(endpoint, params))
+    _response_cache[key] = (loop.time() + TTL.get(endpoint, DEFAULT_TTL), task)
+    while len(_response_cache) > CACHE_MAX_SIZE:
+        _response_cache.popitem(last=False)
+
+    def evict_failed(done: asyncio.Task):
+        # Don't cache failures, whether or not any caller is still awaiting the task
+        if done.cancelled() or done.exception() is not None:
+            entry = _response_cache.get(key)
+            if entry is not None and entry[1] is done:
+                del _response_cache[key]
+
+    task.add_done_callback(evict_failed)
+    return await asyncio.shield(task)
+
+async def start_redis_client():
+    """
+    Create the shared Redis client if a Redis server is configured
+    """
+    global redis_client
+    if redis_client is None and REDIS_URL:
+        redis_client = Redis.from_url(
+            REDIS_URL,
+            socket_connect_timeout=REDIS_TIMEOUT,
+            socket_timeout=REDIS_TIMEOUT
+        )
+    return redis_client
+
+async def close_redis_client():
+    """
+    Close the shared Redis client
+    """
+    global redis_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+
+def _set_local(key: str, value: bytes, ttl: float):
+    _local_cache[key] = (time.monotonic() + min(ttl, LOCAL_CACHE_TTL), value)
+    _local_cache.move_to_end(key)
+    while len(_local_cache) > LOCAL_CACHE_MAX_SIZE:
+        _local_cache.popitem(last=False)
+
+async def cache_get(key: str) -> Optional[Any]:
+    """
+    Look up a cached response, first in-process and then in Redis.
+    Returns None on a miss.
+    """
+    entry = _local_cache.get(key)
+    if entry is not None:
+        expiry, value = entry
+        if expiry > time.monotonic():
+            _local_cache.move_to_end(key)
+            return orjson.loads(value)
+        del _local_cache[key]
+
+    if redis_client is None:
+        return None
+    try:
+        # Fetch the remaining TTL with the value so the local copy never outlives the Redis key
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.pttl(key)
+            value, ttl_ms = await pipe.execute()
+    except RedisError:
+        # Redis being unavailable is just a cache miss
+        return None
+    if value is None:
+        return None
+    # pttl is -1 for keys without an expiry
+    _set_local(key, value, ttl_ms / 1000 if ttl_ms >= 0 else LOCAL_CACHE_TTL)
+    return orjson.loads(value)
+
+async def cache_set(key: str, value: Any, ttl: int):
+    """
+    Store a response in the in-process cache and in Redis for ttl seconds
+    """
+    serialized = orjson.dumps(value)
+    _set_local(key, serialized, ttl)
+    if redis_client is None:
+        return
+    try:
+        await redis_client.setex(key, ttl, serialized)
+    except RedisError:
+        pass
@@ -1,7 +1,11 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+from pymongo.write_concern import WriteConcern
 from dotenv import load_dotenv
+import asyncio
 import os
-from datetime import datetime
+import re
+from datetime import datetime, timezone
 
 # Load environment variables
 load_dotenv()
@@ -10,6 +14,10 @@ load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("DB_NAME")
 
+# Every uvicorn worker opens its own pool, so size it per worker:
+#   MONGO_POOL = Mongo connection limit / WEB_CONCURRENCY (workers default to 2 * cores + 1)
+MONGO_POOL = int(os.getenv("MONGO_POOL", "20"))
+
 # Connect to MongoDB
 client = None
 
@@ -20,15 +28,28 @@ def get_database():
     """
     global client
     if client is None:
-        client = MongoClient(MONGODB_URI)
+        client = AsyncIOMotorClient(
+            MONGODB_URI,
+            maxPoolSize=MONGO_POOL,
+            minPoolSize=min(2, MONGO_POOL),
+            serverSelectionTimeoutMS=3000
+        )
     return client[DB_NAME]
 
-def get_collection(collection_name):
+async def ensure_indexes():
     """
-    Returns a specific collection from the database.
+    Create the indexes backing each getter's filter and sort.
+    create_index is a no-op when the index already exists.
     """
     db = get_database()
-    return db[collection_name]
+    try:
+        await db[MARKET_DATA_COLLECTION].create_index([("timestamp", -1)])
+        await db[NEWS_COLLECTION].create_index([("published_at", -1)])
+        await db[SENTIMENT_COLLECTION].create_index([("coin", 1), ("timestamp", -1)])
+        await db[TRADES_COLLECTION].create_index([("user_id", 1), ("timestamp", -1)])
+    except PyMongoError:
+        # Queries still work without indexes, just slower
+        pass
 
 # Collections
 MARKET_DATA_COLLECTION = "market_data"
@@ -36,60 +57,162 @@ NEWS_COLLECTION = "news"
 SENTIMENT_COLLECTION = "sentiment"
 TRADES_COLLECTION = "trades"
 
-def store_market_data(data):
+# Telemetry collections are written fire-and-forget (no server acknowledgement);
+# trades keep the default write concern since they must not be lost
+UNACKNOWLEDGED_COLLECTIONS = {MARKET_DATA_COLLECTION, NEWS_COLLECTION, SENTIMENT_COLLECTION}
+
+# Buffered writes are flushed in one insert_many every interval or once a buffer fills up
+WRITE_FLUSH_INTERVAL = 0.5
+WRITE_BATCH_SIZE = 100
+_write_buffers = {}
+
+def get_collection(collection_name):
+    """
+    Returns a specific collection from the database.
+    """
+    db = get_database()
+    if collection_name in UNACKNOWLEDGED_COLLECTIONS:
+        return db.get_collection(collection_name, write_concern=WriteConcern(w=0))
+    return db[collection_name]
+
+async def buffer_document(collection_name, document):
+    """
+    Queue a document for a batched insert into the given collection
+    """
+    buffer = _write_buffers.setdefault(collection_name, [])
+    buffer.append(document)
+    if len(buffer) >= WRITE_BATCH_SIZE:
+        await flush_collection(collection_name)
+
+async def flush_collection(collection_name):
+    """
+    Insert all buffered documents for a collection in one unordered bulk write
+    """
+    documents = _write_buffers.pop(collection_name, None)
+    if documents:
+        return await get_collection(collection_name).insert_many(documents, ordered=False)
+    return None
+
+async def flush_writes():
+    """
+    Flush every write buffer
+    """
+    for collection_name in list(_write_buffers):
+        await flush_collection(collection_name)
+
+async def run_write_flusher():
+    """
+    Background task that periodically flushes buffered writes
+    """
+    try:
+        while True:
+            await asyncio.sleep(WRITE_FLUSH_INTERVAL)
+            try:
+                await flush_writes()
+            except Exception:
+                # Telemetry writes are best-effort; keep the flusher alive
+                pass
+    finally:
+        # Final flush on shutdown; never let a write error mask the cancellation
+        try:
+            await flush_writes()
+        except Exception:
+            pass
+
+async def store_market_data(data):
     """
     Store market data in MongoDB
     """
-    collection = get_collection(MARKET_DATA_COLLECTION)
-    data["timestamp"] = datetime.utcnow()
-    return collection.insert_one(data)
+    data["timestamp"] = datetime.now(timezone.utc)
+    # Buffer a copy so the caller's dict isn't mutated with an _id on insert
+    await buffer_document(MARKET_DATA_COLLECTION, dict(data))
 
-def get_latest_market_data():
+async def get_latest_market_data():
     """
     Get the latest market data from MongoDB
     """
     collection = get_collection(MARKET_DATA_COLLECTION)
-    return collection.find_one(sort=[("timestamp", -1)])
+    return await collection.find_one(sort=[("timestamp", -1)], projection={"_id": 0})
 
-def store_news(news_items):
+async def store_news(news_items):
     """
     Store news items in MongoDB
     """
     collection = get_collection(NEWS_COLLECTION)
+    # One timestamp for the whole batch
+    now = datetime.now(timezone.utc)
     for item in news_items:
-        item["stored_at"] = datetime.utcnow()
+        item["stored_at"] = now
     if isinstance(news_items, list) and len(news_items) > 0:
-        return collection.insert_many(news_items)
+        # Insert copies so the caller's items aren't mutated with an _id
+        return await collection.insert_many([dict(item) for item in news_items], ordered=False)
     return None
 
-def get_recent_news(limit=10):
+async def get_recent_news(limit=10, coins=None):
     """
-    Get recent news items from MongoDB
+    Get recent news items from MongoDB, optionally only those mentioning one of the given coins
     """
     collection = get_collection(NEWS_COLLECTION)
-    return list(collection.find(sort=[("published_at", -1)]).limit(limit))
+    query = {}
+    if coins:
+        # Whole-word, case-sensitive match so e.g. ETH doesn't match "whether"
+        pattern = {"$regex": r"\b(?:" + "|".join(re.escape(coin) for coin in coins) + r")\b"}
+        query["$or"] = [
+            {"title": pattern},
+            {"description": pattern},
+            {"related_coins.symbol": {"$in": coins}}
+        ]
+    return await collection.find(query, {"_id": 0}, sort=[("published_at", -1)]).limit(limit).to_list(length=limit)
 
-def store_sentiment(coin, text, score):
+async def store_sentiment(coin, text, score, label):
     """
     Store sentiment analysis result in MongoDB
     """
-    collection = get_collection(SENTIMENT_COLLECTION)
     document = {
         "coin": coin,
         "text": text,
         "sentiment_score": score,
-        "timestamp": datetime.utcnow()
+        "sentiment_label": label,
+        "timestamp": datetime.now(timezone.utc)
     }
-    return collection.insert_one(document)
+    await buffer_document(SENTIMENT_COLLECTION, document)
 
-def get_sentiment_history(coin, limit=10):
+async def get_sentiment_history(coin, since, limit=100):
     """
-    Get sentiment history for a specific coin
+    Get the most recent sentiment history for a specific coin recorded at or after `since`
     """
     collection = get_collection(SENTIMENT_COLLECTION)
-    return list(collection.find({"coin": coin}, sort=[("timestamp", -1)]).limit(limit))
+    # Documents stored before labels were persisted get one derived from the score,
+    # using the same thresholds as routers.sentiment.get_sentiment_label
+    projection = {
+        "_id": 0,
+        "coin": 1,
+        "text": 1,
+        "sentiment_score": 1,
+        "timestamp": 1,
+        "sentiment_label": {
+            "$ifNull": [
+                "$sentiment_label",
+                {
+                    "$switch": {
+                        "branches": [
+                            {"case": {"$gt": ["$sentiment_score", 0.2]}, "then": "positive"},
+                            {"case": {"$lt": ["$sentiment_score", -0.2]}, "then": "negative"}
+                        ],
+                        "default": "neutral"
+                    }
+                }
+            ]
+        }
+    }
+    cursor = collection.find(
+        {"coin": coin, "timestamp": {"$gte": since}},
+        projection,
+        sort=[("timestamp", -1)]
+    ).limit(limit)
+    return await cursor.to_list(length=limit)
 
-def record_trade(user_id, coin, action, amount, price):
+async def record_trade(user_id, coin, action, amount, price):
     """
     Record a trade in MongoDB
     """
@@ -100,11 +223,11 @@ def record_trade(user_id, coin, action, amount, price):
         "action": action,  # "buy" or "sell"
         "amount": amount,
         "price": price,
-        "timestamp": datetime.utcnow()
+        "timestamp": datetime.now(timezone.utc)
     }
-    return collection.insert_one(trade)
+    return await collection.insert_one(trade)
 
-def get_trade_history(user_id=None, limit=20):
+async def get_trade_history(user_id=None, limit=20):
     """
     Get trade history, optionally filtered by user_id
     """
@@ -112,4 +235,4 @@ def get_trade_history(user_id=None, limit=20):
     query = {}
     if user_id:
         query["user_id"] = user_id
-    return list(collection.find(query, sort=[("timestamp", -1)]).limit(limit)) 
\ No newline at end of file
+    return await collection.find(query, {"_id": 0}, sort=[("timestamp", -1)]).limit(limit).to_list(length=limit) 
\ No newline at end of file
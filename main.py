@@ -1,8 +1,12 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import uvicorn
 from dotenv import load_dotenv
 import os
+import asyncio
+import clients
+import database
 
 # Load environment variables
 load_dotenv()
@@ -11,7 +15,9 @@ load_dotenv()
 app = FastAPI(
     title="Crypto Trading Bot API",
     description="API for cryptocurrency market data, news, sentiment analysis, and trading",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson is much faster than the stdlib encoder and serializes datetimes natively
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -23,6 +29,28 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+@app.on_event("startup")
+async def startup():
+    # Open the shared CoinMarketCap connection pool
+    await clients.start_http_client()
+    await clients.start_redis_client()
+    await database.ensure_indexes()
+    # Periodically flush batched telemetry writes to MongoDB
+    app.state.write_flusher = asyncio.create_task(database.run_write_flusher())
+    # Load FinBERT and run a warmup pass off the event loop before serving traffic
+    await asyncio.get_running_loop().run_in_executor(None, sentiment.warmup_sentiment_model)
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.write_flusher.cancel()
+    try:
+        await app.state.write_flusher
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await clients.close_http_client()
+        await clients.close_redis_client()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Crypto Trading Bot API. Use /docs to see available endpoints."}
@@ -37,4 +65,17 @@ app.include_router(sentiment.router, prefix="/api", tags=["Sentiment"])
 app.include_router(trading.router, prefix="/api", tags=["Trading"])
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # Auto-reload is for development only (and forces a single worker)
+    reload = os.getenv("RELOAD", "0") == "1"
+    # Number of worker processes; defaults to the 2 * cores + 1 rule of thumb
+    workers = 1 if reload else int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    # Export it so worker processes (e.g. the ONNX Runtime thread setup) see the real worker count
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    # Build the ONNX sentiment model once here, before any worker starts
+    try:
+        sentiment.ensure_sentiment_model()
+    except Exception:
+        # Workers retry on warmup and disable only the sentiment endpoints if it still fails
+        pass
+    # "auto" selects uvloop and httptools when they are installed
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers, reload=reload, loop="auto", http="auto")
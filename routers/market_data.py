@@ -1,37 +1,13 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
-import requests
-import os
-from dotenv import load_dotenv
 from typing import List, Optional, Dict, Any
 import database
+from clients import fetch_from_coinmarketcap, cache_get, cache_set
 
-# Load environment variables
-load_dotenv()
-
-# Get API key
-COINMARKETCAP_API_KEY = os.getenv("COINMARKETCAP_API_KEY")
+# How long /market-data responses are served from the response cache (seconds)
+MARKET_DATA_CACHE_TTL = 30
 
 router = APIRouter()
 
-async def fetch_from_coinmarketcap(endpoint: str, params: dict = None) -> Dict:
-    """
-    Helper function to fetch data from CoinMarketCap API
-    """
-    base_url = "https://pro-api.coinmarketcap.com/v1"
-    url = f"{base_url}/{endpoint}"
-    
-    headers = {
-        "X-CMC_PRO_API_KEY": COINMARKETCAP_API_KEY,
-        "Accept": "application/json"
-    }
-    
-    try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching data from CoinMarketCap: {str(e)}")
-
 @router.get("/market-data")
 async def get_market_data(
     symbols: str = Query(default="BTC,ETH,XRP,LTC,ADA", description="Comma-separated list of coin symbols"),
@@ -41,13 +17,18 @@ async def get_market_data(
     """
     Get current market data for the specified cryptocurrencies
     """
+    # Key shared by all workers through Redis
+    cache_key = f"shared:market:{symbols}:{limit}"
+    
     # Try to get cached data if requested
     if use_cache:
-        cached_data = database.get_latest_market_data()
+        cached_data = await cache_get(cache_key)
+        if cached_data is not None:
+            return cached_data
+        
+        cached_data = await database.get_latest_market_data()
         if cached_data:
-            # Remove MongoDB _id field
-            if "_id" in cached_data:
-                del cached_data["_id"]
+            await cache_set(cache_key, cached_data, MARKET_DATA_CACHE_TTL)
             return cached_data
     
     # Split the symbols string into a list
@@ -82,7 +63,8 @@ async def get_market_data(
             }
     
     # Store data in the database
-    database.store_market_data(result)
+    await database.store_market_data(result)
+    await cache_set(cache_key, result, MARKET_DATA_CACHE_TTL)
     
     return result
 
@@ -1,66 +1,34 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
-import requests
-import os
-from dotenv import load_dotenv
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
+import re
 import database
+from clients import fetch_from_coinmarketcap, cache_get, cache_set
 
-# Load environment variables
-load_dotenv()
-
-# Get API key
-COINMARKETCAP_API_KEY = os.getenv("COINMARKETCAP_API_KEY")
+# How long news responses are served from the response cache (seconds)
+NEWS_CACHE_TTL = 120
 
 router = APIRouter()
 
-async def fetch_from_coinmarketcap(endpoint: str, params: dict = None) -> Dict:
+async def fetch_news(coins: Optional[str], limit: int, use_cache: bool) -> List[Dict]:
     """
-    Helper function to fetch data from CoinMarketCap API
+    Get latest cryptocurrency news, optionally filtered by a comma-separated list of coins
     """
-    base_url = "https://pro-api.coinmarketcap.com/v1"
-    url = f"{base_url}/{endpoint}"
-    
-    headers = {
-        "X-CMC_PRO_API_KEY": COINMARKETCAP_API_KEY,
-        "Accept": "application/json"
-    }
+    # Key shared by all workers through Redis
+    cache_key = f"shared:news:{coins}:{limit}"
     
-    try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching data from CoinMarketCap: {str(e)}")
-
-@router.get("/crypto-news")
-async def get_crypto_news(
-    coins: Optional[str] = Query(default=None, description="Comma-separated list of coin symbols to filter news"),
-    limit: int = Query(default=10, description="Number of news articles to return"),
-    use_cache: bool = Query(default=True, description="Whether to use cached news if available")
-):
-    """
-    Get latest cryptocurrency news
-    """
     # Try to get cached news if requested
     if use_cache:
-        cached_news = database.get_recent_news(limit=limit)
+        cached_news = await cache_get(cache_key)
+        if cached_news is not None:
+            return cached_news
+        
+        # Filter by coins if specified (done by the database query)
+        coin_list = [coin.strip().upper() for coin in coins.split(",")] if coins else None
+        cached_news = await database.get_recent_news(limit=limit, coins=coin_list)
         if cached_news and len(cached_news) > 0:
-            # Remove MongoDB _id field
-            for article in cached_news:
-                if "_id" in article:
-                    del article["_id"]
-            
-            # Filter by coins if specified
-            if coins:
-                coin_list = [coin.strip().upper() for coin in coins.split(",")]
-                filtered_news = [
-                    article for article in cached_news 
-                    if any(coin in article.get("title", "") or coin in article.get("description", "") for coin in coin_list)
-                ]
-                return {"news": filtered_news}
-            
-            return {"news": cached_news}
+            await cache_set(cache_key, cached_news, NEWS_CACHE_TTL)
+            return cached_news
     
     # Fetch data from CoinMarketCap - latest endpoint for news
     params = {
@@ -88,23 +56,24 @@ async def get_crypto_news(
             # Filter by coins if specified
             if coins:
                 coin_list = [coin.strip().upper() for coin in coins.split(",")]
+                coin_set = set(coin_list)
+                # Compile the coin match once instead of testing every coin against every article
+                coin_pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, coin_list)) + r")\b")
                 news_items = [
                     item for item in news_items 
-                    if any(
-                        coin in item.get("title", "") or 
-                        coin in item.get("description", "") or
-                        any(coin == related_coin.get("symbol") for related_coin in item.get("related_coins", []))
-                        for coin in coin_list
-                    )
+                    if coin_pattern.search(item.get("title") or "") or
+                    coin_pattern.search(item.get("description") or "") or
+                    any(related_coin.get("symbol") in coin_set for related_coin in item.get("related_coins", []))
                 ]
             
             # Limit results
             news_items = news_items[:limit]
             
             # Store news in database
-            database.store_news(news_items)
+            await database.store_news(news_items)
+            await cache_set(cache_key, news_items, NEWS_CACHE_TTL)
             
-            return {"news": news_items}
+            return news_items
         else:
             raise HTTPException(status_code=500, detail="Failed to fetch news data")
     except Exception as e:
@@ -132,6 +101,17 @@ async def get_crypto_news(
             simulated_news.append(news_item)
         
         # Store simulated news in database for later use
-        database.store_news(simulated_news)
+        await database.store_news(simulated_news)
         
-        return {"news": simulated_news} 
\ No newline at end of file
+        return simulated_news 
+
+@router.get("/crypto-news")
+async def get_crypto_news(
+    coins: Optional[str] = Query(default=None, description="Comma-separated list of coin symbols to filter news"),
+    limit: int = Query(default=10, description="Number of news articles to return"),
+    use_cache: bool = Query(default=True, description="Whether to use cached news if available")
+):
+    """
+    Get latest cryptocurrency news
+    """
+    return {"news": await fetch_news(coins=coins, limit=limit, use_cache=use_cache)}
@@ -1,13 +1,19 @@
 from fastapi import APIRouter, HTTPException, Query, Body, Depends
+import asyncio
 import os
+import re
 import database
+from routers.news import fetch_news
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-import requests
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import numpy as np
-from datetime import datetime
+import onnxruntime as ort
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from filelock import FileLock
 
 router = APIRouter()
 
@@ -23,52 +29,150 @@ class SentimentResponse(BaseModel):
     sentiment_label: str
     timestamp: str
 
-# Load sentiment analysis model (lazy loading)
-sentiment_model = None
-tokenizer = None
+# Using a pre-trained FinBERT model for financial sentiment analysis
+# This is suitable for crypto news and market sentiment
+MODEL_NAME = "ProsusAI/finbert"
 
+# FP32 ONNX export and its INT8-quantized version, built once and reused across restarts
+ONNX_MODEL_PATH = os.getenv("FINBERT_ONNX_PATH", "finbert.onnx")
+QUANTIZED_MODEL_PATH = os.getenv("FINBERT_QUANTIZED_PATH", "finbert_int8.onnx")
+
+def export_sentiment_model(tokenizer):
+    """
+    Export the model to ONNX and quantize its weights to INT8.
+    Files are written under temporary names and moved into place, so a reader
+    never sees a partially written model.
+    """
+    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME, return_dict=False)
+    model.eval()
+    
+    onnx_tmp_path = f"{ONNX_MODEL_PATH}.{os.getpid()}.tmp"
+    quantized_tmp_path = f"{QUANTIZED_MODEL_PATH}.{os.getpid()}.tmp"
+    
+    dummy = tokenizer("warmup", return_tensors="pt")
+    # Pin the TorchScript exporter; the dynamo exporter needs onnxscript and treats
+    # opset_version/dynamic_axes differently
+    torch.onnx.export(
+        model,
+        (dummy["input_ids"], dummy["attention_mask"]),
+        onnx_tmp_path,
+        opset_version=17,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"}
+        },
+        dynamo=False
+    )
+    quantize_dynamic(onnx_tmp_path, quantized_tmp_path, weight_type=QuantType.QInt8)
+    
+    # The quantized model is what readers check for, so it goes into place last
+    os.replace(onnx_tmp_path, ONNX_MODEL_PATH)
+    os.replace(quantized_tmp_path, QUANTIZED_MODEL_PATH)
+
+def ensure_sentiment_model(tokenizer=None):
+    """
+    Build the quantized ONNX model if it doesn't exist yet.
+    A file lock makes concurrent workers wait for a single export instead of racing.
+    """
+    if os.path.exists(QUANTIZED_MODEL_PATH):
+        return
+    
+    with FileLock(f"{QUANTIZED_MODEL_PATH}.lock"):
+        # Another process may have finished the export while we waited
+        if os.path.exists(QUANTIZED_MODEL_PATH):
+            return
+        export_sentiment_model(tokenizer or AutoTokenizer.from_pretrained(MODEL_NAME))
+
+# Load sentiment analysis model once per process (warmed on app startup)
+@lru_cache(maxsize=1)
 def get_sentiment_model():
-    global sentiment_model, tokenizer
-    if sentiment_model is None or tokenizer is None:
-        # Using a pre-trained FinBERT model for financial sentiment analysis
-        # This is suitable for crypto news and market sentiment
-        model_name = "ProsusAI/finbert"
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        sentiment_model = AutoModelForSequenceClassification.from_pretrained(model_name)
-    return sentiment_model, tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    ensure_sentiment_model(tokenizer)
+    
+    # ONNX Runtime fuses attention, layernorm and GELU into single kernels
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # With several uvicorn workers, one intra-op thread per worker avoids CPU oversubscription
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        options.intra_op_num_threads = 1
+    
+    session = ort.InferenceSession(QUANTIZED_MODEL_PATH, sess_options=options, providers=["CPUExecutionProvider"])
+    return session, tokenizer
+
+def predict_probabilities(inputs) -> np.ndarray:
+    """
+    Run the model on tokenized inputs and return class probabilities per text
+    """
+    session, _ = get_sentiment_model()
+    logits = session.run(["logits"], {
+        "input_ids": inputs["input_ids"],
+        "attention_mask": inputs["attention_mask"]
+    })[0]
+    
+    # Softmax over the class dimension
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+# Set when the model can't be built or loaded; only the inference endpoints are disabled
+model_load_error: Optional[str] = None
+
+def warmup_sentiment_model():
+    """
+    Load the model and run one dummy forward pass so the first real request doesn't pay for it
+    """
+    global model_load_error
+    try:
+        analyze_text_sentiment("warmup")
+    except Exception as e:
+        model_load_error = str(e)
+
+def require_sentiment_model():
+    """
+    Reject inference requests when the model failed to load at startup
+    """
+    if model_load_error is not None:
+        raise HTTPException(status_code=503, detail=f"Sentiment model unavailable: {model_load_error}")
+
+def get_sentiment_label(sentiment_score: float) -> str:
+    """
+    Map a sentiment score (-1 to 1) to a label
+    """
+    if sentiment_score > 0.2:
+        return "positive"
+    elif sentiment_score < -0.2:
+        return "negative"
+    return "neutral"
 
 def analyze_text_sentiment(text: str) -> Dict[str, Any]:
     """
     Analyze the sentiment of text using a pre-trained model
     """
-    model, tokenizer = get_sentiment_model()
+    _, tokenizer = get_sentiment_model()
     
-    # Tokenize the text
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
+    # Tokenize the text (a single text needs no padding; FinBERT ignores segment ids)
+    inputs = tokenizer(
+        text,
+        return_tensors="np",
+        truncation=True,
+        max_length=128,
+        return_attention_mask=True,
+        return_token_type_ids=False
+    )
     
     # Get model prediction
-    with torch.no_grad():
-        outputs = model(**inputs)
-        predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
-        
     # FinBERT returns probabilities for [negative, neutral, positive]
-    scores = predictions[0].numpy()
+    scores = predict_probabilities(inputs)[0]
     
     # Calculate sentiment score (-1 to 1)
     # -1 is very negative, 0 is neutral, 1 is very positive
     sentiment_score = float(scores[2] - scores[0])  # positive - negative
     
-    # Get sentiment label
-    if sentiment_score > 0.2:
-        sentiment_label = "positive"
-    elif sentiment_score < -0.2:
-        sentiment_label = "negative"
-    else:
-        sentiment_label = "neutral"
-    
     return {
         "sentiment_score": sentiment_score,
-        "sentiment_label": sentiment_label,
+        "sentiment_label": get_sentiment_label(sentiment_score),
         "raw_scores": {
             "negative": float(scores[0]),
             "neutral": float(scores[1]),
@@ -76,20 +180,60 @@ def analyze_text_sentiment(text: str) -> Dict[str, Any]:
         }
     }
 
+def analyze_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    """
+    Analyze the sentiment of many texts in a single forward pass
+    """
+    if not texts:
+        return []
+    
+    _, tokenizer = get_sentiment_model()
+    
+    # Inputs are short (title + start of description), so 128 tokens is plenty
+    inputs = tokenizer(
+        texts,
+        return_tensors="np",
+        truncation=True,
+        padding=True,
+        max_length=128,
+        return_attention_mask=True,
+        return_token_type_ids=False
+    )
+    
+    scores = predict_probabilities(inputs)
+    
+    # FinBERT returns probabilities for [negative, neutral, positive]
+    sentiment_scores = scores[:, 2] - scores[:, 0]
+    
+    return [
+        {
+            "sentiment_score": float(sentiment_score),
+            "sentiment_label": get_sentiment_label(float(sentiment_score)),
+            "raw_scores": {
+                "negative": float(row[0]),
+                "neutral": float(row[1]),
+                "positive": float(row[2])
+            }
+        }
+        for sentiment_score, row in zip(sentiment_scores, scores)
+    ]
+
 @router.post("/analyze-sentiment", response_model=SentimentResponse)
 async def analyze_sentiment(request: SentimentRequest):
     """
     Analyze the sentiment of text for a specific cryptocurrency
     """
+    require_sentiment_model()
+    
     text = request.text
     coin = request.coin.upper()
     
     try:
-        # Analyze sentiment
-        sentiment_result = analyze_text_sentiment(text)
+        # Analyze sentiment (CPU-bound, so off the event loop)
+        sentiment_result = await asyncio.get_running_loop().run_in_executor(None, analyze_text_sentiment, text)
         
         # Store result in database
-        database.store_sentiment(coin, text, sentiment_result["sentiment_score"])
+        await database.store_sentiment(coin, text, sentiment_result["sentiment_score"], sentiment_result["sentiment_label"])
         
         # Prepare response
         response = {
@@ -107,7 +251,8 @@ async def analyze_sentiment(request: SentimentRequest):
 @router.get("/coin-sentiment/{coin}")
 async def get_coin_sentiment(
     coin: str,
-    days: int = Query(default=7, description="Number of days of sentiment history to return")
+    days: int = Query(default=7, description="Number of days of sentiment history to return"),
+    limit: int = Query(default=100, ge=1, le=1000, description="Maximum number of sentiment entries to return")
 ):
     """
     Get sentiment history for a specific cryptocurrency
@@ -115,32 +260,12 @@ async def get_coin_sentiment(
     coin = coin.upper()
     
     # Get sentiment history from database
-    sentiment_history = database.get_sentiment_history(coin, limit=days * 10)  # Approximate, could have multiple per day
-    
-    if not sentiment_history:
-        return {"coin": coin, "sentiment_history": []}
-    
-    # Format response
-    formatted_history = []
-    for item in sentiment_history:
-        if "_id" in item:
-            del item["_id"]
-        
-        # Add sentiment label if it doesn't exist
-        if "sentiment_label" not in item:
-            score = item.get("sentiment_score", 0)
-            if score > 0.2:
-                item["sentiment_label"] = "positive"
-            elif score < -0.2:
-                item["sentiment_label"] = "negative"
-            else:
-                item["sentiment_label"] = "neutral"
-                
-        formatted_history.append(item)
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    sentiment_history = await database.get_sentiment_history(coin, since=since, limit=limit)
     
     return {
         "coin": coin,
-        "sentiment_history": formatted_history
+        "sentiment_history": sentiment_history
     }
 
 @router.get("/analyze-news-sentiment")
@@ -151,58 +276,84 @@ async def analyze_news_sentiment(
     """
     Fetch recent news for given coins and analyze their sentiment
     """
-    coin_list = [coin.strip().upper() for coin in coins.split(",")]
+    require_sentiment_model()
+    
+    # Deduplicate while keeping order, so each coin has one slot in the aggregation arrays
+    coin_list = list(dict.fromkeys(coin.strip().upper() for coin in coins.split(",")))
     results = {}
     
-    for coin in coin_list:
-        # Get news for this coin
-        try:
-            response = requests.get(
-                f"http://localhost:8000/api/crypto-news?coins={coin}&limit={limit}", 
-                timeout=10
-            )
-            news_data = response.json()
-            
-            coin_results = []
-            
-            for article in news_data.get("news", []):
-                # Only analyze the title and first part of description to keep it manageable
-                text = f"{article.get('title', '')}. {article.get('description', '')[:100]}"
-                
-                # Analyze sentiment
-                sentiment_result = analyze_text_sentiment(text)
-                
-                # Store in database
-                database.store_sentiment(coin, text, sentiment_result["sentiment_score"])
-                
-                coin_results.append({
-                    "title": article.get("title"),
-                    "url": article.get("url"),
-                    "published_at": article.get("published_at"),
-                    "sentiment_score": sentiment_result["sentiment_score"],
-                    "sentiment_label": sentiment_result["sentiment_label"]
-                })
-            
-            # Calculate average sentiment
-            if coin_results:
-                avg_sentiment = sum(item["sentiment_score"] for item in coin_results) / len(coin_results)
-                
-                results[coin] = {
-                    "articles": coin_results,
-                    "average_sentiment": avg_sentiment,
-                    "overall_sentiment": "positive" if avg_sentiment > 0.2 else "negative" if avg_sentiment < -0.2 else "neutral"
-                }
-            else:
-                results[coin] = {
-                    "articles": [],
-                    "average_sentiment": 0,
-                    "overall_sentiment": "neutral"
-                }
-                
-        except Exception as e:
-            results[coin] = {
+    # Fetch news for all coins in one call instead of one request per coin
+    try:
+        news = await fetch_news(coins=",".join(coin_list), limit=limit * len(coin_list), use_cache=True)
+    except Exception as e:
+        return {
+            coin: {
                 "error": f"Failed to analyze news sentiment: {str(e)}",
                 "articles": []
             }
+            for coin in coin_list
+        }
+    
+    # Bucket articles by coin so they can all be scored in one batch
+    # One precompiled pattern finds every mentioned coin in a single scan per field
+    coin_pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, coin_list)) + r")\b")
+    coin_articles = {coin: [] for coin in coin_list}
+    for article in news:
+        mentioned = {match.group(0) for match in coin_pattern.finditer(article.get("title") or "")}
+        mentioned.update(match.group(0) for match in coin_pattern.finditer(article.get("description") or ""))
+        mentioned.update(related_coin.get("symbol") for related_coin in article.get("related_coins", []))
+        for coin in mentioned:
+            if coin in coin_articles:
+                coin_articles[coin].append(article)
+    
+    pending = []  # (coin index, article, text)
+    for coin_index, coin in enumerate(coin_list):
+        results[coin] = {"articles": []}
+        for article in coin_articles[coin][:limit]:
+            # Only analyze the title and first part of description to keep it manageable
+            text = f"{article.get('title') or ''}. {(article.get('description') or '')[:100]}"
+            pending.append((coin_index, article, text))
+    
+    try:
+        # Inference is CPU-bound; run it off the event loop
+        sentiment_results = await asyncio.get_running_loop().run_in_executor(
+            None, analyze_batch, [text for _, _, text in pending]
+        )
+    except Exception as e:
+        for coin_index in {coin_index for coin_index, _, _ in pending}:
+            results[coin_list[coin_index]] = {
+                "error": f"Failed to analyze news sentiment: {str(e)}",
+                "articles": []
+            }
+        return results
+    
+    for (coin_index, article, text), sentiment_result in zip(pending, sentiment_results):
+        coin = coin_list[coin_index]
+        
+        # Store in database
+        await database.store_sentiment(coin, text, sentiment_result["sentiment_score"], sentiment_result["sentiment_label"])
+        
+        results[coin]["articles"].append({
+            "title": article.get("title"),
+            "url": article.get("url"),
+            "published_at": article.get("published_at"),
+            "sentiment_score": sentiment_result["sentiment_score"],
+            "sentiment_label": sentiment_result["sentiment_label"]
+        })
+    
+    # Calculate average sentiment per coin in one pass over the score array
+    coin_indices = np.array([coin_index for coin_index, _, _ in pending], dtype=np.intp)
+    scores = np.array([sentiment_result["sentiment_score"] for sentiment_result in sentiment_results], dtype=float)
+    counts = np.bincount(coin_indices, minlength=len(coin_list))
+    sums = np.bincount(coin_indices, weights=scores, minlength=len(coin_list))
+    
+    for coin_index, coin in enumerate(coin_list):
+        if counts[coin_index]:
+            avg_sentiment = float(sums[coin_index] / counts[coin_index])
+            results[coin]["average_sentiment"] = avg_sentiment
+            results[coin]["overall_sentiment"] = get_sentiment_label(avg_sentiment)
+        else:
+            results[coin]["average_sentiment"] = 0
+            results[coin]["overall_sentiment"] = "neutral"
     
-    return results 
\ No newline at end of file
+    return results